@@ -0,0 +1,146 @@
+from neo4j import GraphDatabase
+from contextlib import contextmanager
+import configparser
+import config
+
+# Drivers are thread safe and pool their own connections, so one is shared per configuration file
+_DRIVERS = {}
+# neo4jsbml connections hold a driver too, so they are shared the same way
+_CONNECTIONS = {}
+
+
+class SbmlConnection:
+    """
+    Connection shared by SbmlDatabase and SbmlDatabaseQueries.
+    Wraps the neo4jsbml connection (used to write mapped sbml graphs) together with a neo4j driver,
+    so that queries can be sent with parameters instead of being formatted into the query text.
+
+    Attributes:
+    -----------
+    connection : neo4jsbml.connect.Connect
+        neo4jsbml connection created from the same configuration file.
+    driver : neo4j.Driver
+        Driver used to run queries against the database.
+    database : str
+        Name of the neo4j database queries are run on.
+
+    Methods:
+    --------
+    from_config(config_path, create_connection):
+        Creates a connection from a Neo4j configuration (.ini) file.
+
+    session():
+        Reuses a single session for all queries run inside a with block.
+
+    query(query, expect_data, parameters, write):
+        Runs a query and returns its records if data is expected.
+
+    query_batches(query, batches):
+        Runs a write query for every batch of rows, one transaction per batch.
+
+    create_nodes(nodes):
+        Imports nodes formatted by neo4jsbml.
+
+    create_relationships(relationships):
+        Imports relationships formatted by neo4jsbml.
+
+    close():
+        Closes the driver.
+    """
+
+    def __init__(self, connection, driver, database, config_path=None):
+        self.connection = connection
+        self.driver = driver
+        self.database = database
+        self.config_path = config_path
+        self._session = None # Session shared by queries inside session()
+
+    @classmethod
+    def from_config(cls, config_path, create_connection):
+        """
+        Use configuration (.ini) file to extract connection arguments using configparser
+            -- the driver and neo4jsbml connection of an earlier connection from the same file are reused
+            -- create_connection builds the neo4jsbml connection, it is only called for a new file
+            -- the driver talks Bolt (neo4j:// or bolt:// protocol) and pools its connections
+        """
+
+        ini = configparser.ConfigParser()
+        ini.read(config_path)
+
+        protocol = ini.get('connection', 'protocol')
+        url = ini.get('connection', 'url')
+        port = ini.get('connection', 'port')
+        user = ini.get('database', 'user')
+        password = ini.get('database', 'password')
+        database = ini.get('database', 'name', fallback='neo4j')
+        uri = f"{protocol}://{url}:{port}"
+
+        if config_path not in _DRIVERS:
+            _DRIVERS[config_path] = GraphDatabase.driver(uri, auth=(user, password),
+                                                         max_connection_pool_size=config.MAX_CONNECTION_POOL_SIZE)
+
+        if config_path not in _CONNECTIONS:
+            _CONNECTIONS[config_path] = create_connection()
+
+        return cls(_CONNECTIONS[config_path], _DRIVERS[config_path], database, config_path)
+
+    @contextmanager
+    def session(self):
+        """
+        Runs all queries inside the with block on one session instead of opening a session per query
+            -- nested calls reuse the outer session
+            -- sessions are not thread safe, only use from the thread that opened it
+        """
+        if self._session is not None:
+            yield self._session
+            return
+
+        with self.driver.session(database=self.database) as session:
+            self._session = session
+            try:
+                yield session
+            finally:
+                self._session = None
+
+    def query(self, query, expect_data=False, parameters=None, write=False):
+        """
+        Runs a query on the database
+            -- parameters are passed to the driver separately from the query text
+            -- queries without data, or with write, run as write transactions, which the driver retries on transient errors
+
+        Return:
+            list: records as dictionaries if expect_data, otherwise None
+        """
+
+        with self.session() as session:
+            if expect_data and write:
+                return session.execute_write(lambda tx: tx.run(query, parameters or {}).data())
+
+            if expect_data:
+                return session.run(query, parameters or {}).data()
+
+            session.execute_write(lambda tx: tx.run(query, parameters or {}).consume())
+
+    def query_batches(self, query, batches):
+        """
+        Runs a write query once for every batch of rows
+            -- every batch is committed in its own write transaction, which the driver retries on transient errors
+        """
+
+        with self.session() as session:
+            for rows in batches:
+                session.execute_write(lambda tx: tx.run(query, {"rows": rows}).consume())
+
+    def create_nodes(self, nodes):
+        """Imports nodes formatted by neo4jsbml"""
+        self.connection.create_nodes(nodes=nodes)
+
+    def create_relationships(self, relationships):
+        """Imports relationships formatted by neo4jsbml"""
+        self.connection.create_relationships(relationships=relationships)
+
+    def close(self):
+        """Closes the driver and all of its connections, including for other connections sharing it"""
+        _DRIVERS.pop(self.config_path, None)
+        _CONNECTIONS.pop(self.config_path, None)
+        self.driver.close()
@@ -1,7 +1,293 @@
 from neo4jsbml import arrows, connect, sbml
 from BiomodelsDownloader import BiomodelsDownloader
 from SbmlDatabaseQueries import SbmlDatabaseQueries
+from SbmlConnection import SbmlConnection
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import numpy as np
+import config
+import csv
+import hashlib
+import json
+import logging
 import os
+import pathlib
+import subprocess
+import tempfile
+
+
+# Messages from import loops go through logging, handlers (e.g. a buffered MemoryHandler) are left to the application
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def _parse_model(path_model, tag, modelisation_path):
+    """
+    Maps an SBML model to a graph and groups its nodes and relationships into query rows
+        -- runs in a worker process, so the schema is loaded from its path and only plain rows are returned
+
+    Return:
+        tuple: (nodes grouped by label, relationships grouped by (type, source label, target label))
+    """
+    arr = _load_arrows(modelisation_path)
+    sbm = sbml.SbmlToNeo4j.from_sbml(path=path_model, tag=tag)
+
+    nod = sbm.format_nodes(nodes=arr.nodes)
+    rel = sbm.format_relationships(relationships=arr.relationships)
+
+    node_rows = defaultdict(list)
+    for node in nod:
+        label = ":".join(node.labels)
+        node_rows[label].append(dict(node.properties, id=_element_key(node.properties), tag=tag))
+
+    # Grouped by endpoint labels so endpoints are matched on their label
+    relationship_rows = defaultdict(list)
+    for relationship in rel:
+        source, target = relationship.source, relationship.target
+        key = (relationship.label, ":".join(source.labels), ":".join(target.labels))
+        relationship_rows[key].append({
+            "tag": tag,
+            "from": _element_key(source.properties),
+            "to": _element_key(target.properties),
+            "props": dict(relationship.properties),
+        })
+
+    return dict(node_rows), dict(relationship_rows)
+
+
+def _element_key(properties):
+    """
+    Identifies a mapped sbml element within its model and label, stored as the id of its node
+        -- the sbml id, or the metaid of elements without one (e.g. kinetic laws)
+        -- elements with neither (e.g. units) are keyed by their properties, so identical ones share a node
+    """
+    if properties.get("id") is not None:
+        return properties["id"]
+
+    if properties.get("metaid") is not None:
+        return properties["metaid"]
+
+    content = {prop: value for prop, value in properties.items() if prop != "tag"}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _node_query(label, properties=None):
+    """
+    Query merging rows of nodes with a label on their tag and id
+        -- with properties, only those are set, otherwise every key of the row is copied
+    """
+    query = f"UNWIND $rows AS row MERGE (n:{label} {{tag: row.tag, id: row.id}})"
+
+    if properties is None:
+        return query + " SET n += row"
+
+    assignments = [f"n.`{prop}` = row.`{prop}`" for prop in properties if prop not in ("tag", "id")]
+    return query + (" SET " + ", ".join(assignments) if assignments else "")
+
+
+def _relationship_merge(rel_type, source_label, target_label, properties=None):
+    """
+    Query body merging a relationship row r between its source and target nodes
+        -- with properties, only those are set, otherwise every key of r.props is copied
+    """
+    query = (f"MATCH (a:{source_label} {{tag: r.tag, id: r.from}}) "
+             f"MATCH (b:{target_label} {{tag: r.tag, id: r.to}}) "
+             f"MERGE (a)-[x:{rel_type}]->(b)")
+
+    if properties is None:
+        return query + " SET x += r.props"
+
+    assignments = [f"x.`{prop}` = r.props.`{prop}`" for prop in properties]
+    return query + (" SET " + ", ".join(assignments) if assignments else "")
+
+
+def _import_id(label, tag, element_id):
+    """
+    Node id used by neo4j-admin, sbml ids are only unique within a label of a model
+        -- element_id is the key _parse_model stores as id, so elements without an sbml id stay distinct
+    """
+    return f"{tag}/{label}/{element_id}"
+
+
+# neo4j-admin header types of python values, matching the types the transactional import stores
+_CSV_TYPES = {bool: "boolean", int: "long", float: "double"}
+
+
+def _csv_field(prop, values):
+    """
+    Typed neo4j-admin header of a property, so numbers and booleans are not imported as strings
+        -- properties whose values mix types are left untyped and imported as strings
+    """
+    types = {type(value) for value in values if value is not None}
+
+    if types == {int, float}:
+        types = {float}
+
+    if len(types) == 1 and next(iter(types)) in _CSV_TYPES:
+        return f"{prop}:{_CSV_TYPES[types.pop()]}"
+
+    return prop
+
+
+def _csv_value(value):
+    """Formats a property for neo4j-admin, which reads booleans as lowercase true/false"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+def _node_properties(label, schema):
+    """Properties exported for nodes of a label besides tag and id, those of the schema as in the compiled import queries"""
+    return [prop for prop in schema["nodes"].get(label, []) if prop not in ("tag", "id")]
+
+
+def _relationship_properties(rel_type, schema):
+    """Properties exported for relationships of a type, those of the schema as in the compiled import queries"""
+    return sorted({prop for (source, typ, target), props in schema["relationships"].items() if typ == rel_type for prop in props})
+
+
+def _write_import_csvs(node_rows, relationship_rows, schema, import_folder):
+    """
+    Writes grouped rows to csv files in the neo4j-admin import format
+        -- nodes_<label>.csv with :ID, :LABEL, tag, id and the schema properties of the label
+        -- rels.csv with :START_ID, :END_ID, :TYPE and the schema properties of the relationship types
+        -- property headers are typed from their values (see _csv_field)
+
+    Return:
+        tuple: (list of node csv paths, relationship csv path)
+    """
+    node_files = []
+
+    for label, rows in node_rows.items():
+        properties = ["tag", "id"] + _node_properties(label, schema)
+        fields = [_csv_field(prop, [row.get(prop) for row in rows]) for prop in properties]
+        path = os.path.join(import_folder, f"nodes_{label.replace(':', '_')}.csv")
+
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow([":ID", ":LABEL"] + fields)
+            for row in rows:
+                writer.writerow([_import_id(label, row["tag"], row["id"]), label.replace(":", ";")]
+                                + [_csv_value(row.get(prop)) for prop in properties])
+
+        node_files.append(path)
+
+    properties = sorted({prop for (rel_type, _, _) in relationship_rows for prop in _relationship_properties(rel_type, schema)})
+    fields = [_csv_field(prop, [row["props"].get(prop) for rows in relationship_rows.values() for row in rows])
+              for prop in properties]
+    relationship_file = os.path.join(import_folder, "rels.csv")
+
+    with open(relationship_file, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([":START_ID", ":END_ID", ":TYPE"] + fields)
+        for (rel_type, source_label, target_label), rows in relationship_rows.items():
+            for row in rows:
+                writer.writerow([
+                    _import_id(source_label, row["tag"], row["from"]),
+                    _import_id(target_label, row["tag"], row["to"]),
+                    rel_type,
+                ] + [_csv_value(row["props"].get(prop)) for prop in properties])
+
+    return node_files, relationship_file
+
+
+def _parquet_column(values):
+    """
+    Keeps the values of a column if they share a type, otherwise stores them as strings as parquet columns have one type
+        -- returns None for columns without values, pyarrow types them as null which neo4j-admin can't import
+    """
+    types = {type(value) for value in values if value is not None}
+
+    if not types:
+        return None
+
+    if len(types) == 1 or types == {int, float}:
+        return values
+
+    return [None if value is None else str(value) for value in values]
+
+
+def _write_import_parquet(node_rows, relationship_rows, schema, outdir):
+    """
+    Writes grouped rows to parquet files in the neo4j-admin import format
+        -- nodes_<label>.parquet per label with :ID, :LABEL, tag, id and the schema properties of the label
+        -- rels_<type>.parquet per relationship type with :START_ID, :END_ID, :TYPE and its schema properties
+        -- properties without any value are left out
+    NB! Requires pyarrow
+
+    Return:
+        tuple: (list of node parquet paths, list of relationship parquet paths)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(outdir, exist_ok=True)
+
+    node_files = []
+    for label, rows in node_rows.items():
+        columns = {
+            ":ID": [_import_id(label, row["tag"], row["id"]) for row in rows],
+            ":LABEL": [label.replace(":", ";")] * len(rows),
+            "tag": [row["tag"] for row in rows],
+            "id": [row["id"] for row in rows],
+        }
+        for prop in _node_properties(label, schema):
+            column = _parquet_column([row.get(prop) for row in rows])
+            if column is not None:
+                columns[prop] = column
+
+        path = os.path.join(outdir, f"nodes_{label.replace(':', '_')}.parquet")
+        pq.write_table(pa.table(columns), path)
+        node_files.append(path)
+
+    # Relationship groups of the same type are written to the same file
+    by_type = defaultdict(list)
+    for (rel_type, source_label, target_label), rows in relationship_rows.items():
+        by_type[rel_type].extend((source_label, target_label, row) for row in rows)
+
+    relationship_files = []
+    for rel_type, rows in by_type.items():
+        columns = {
+            ":START_ID": [_import_id(source_label, row["tag"], row["from"]) for source_label, _, row in rows],
+            ":END_ID": [_import_id(target_label, row["tag"], row["to"]) for _, target_label, row in rows],
+            ":TYPE": [rel_type] * len(rows),
+        }
+        for prop in _relationship_properties(rel_type, schema):
+            column = _parquet_column([row["props"].get(prop) for _, _, row in rows])
+            if column is not None:
+                columns[prop] = column
+
+        path = os.path.join(outdir, f"rels_{rel_type}.parquet")
+        pq.write_table(pa.table(columns), path)
+        relationship_files.append(path)
+
+    return node_files, relationship_files
+
+
+@lru_cache(maxsize=8)
+def _load_arrows(modelisation_path):
+    """Loads a schema once per process, later calls with the same path reuse it"""
+    return arrows.Arrows.from_json(path=modelisation_path)
+
+
+@lru_cache(maxsize=8)
+def _read_schema(modelisation_path):
+    """
+    Reads the labels, properties and relationships of an arrows schema (.json)
+
+    Return:
+        dict: {"nodes": {label: [properties]}, "relationships": {(source label, type, target label): [properties]}}
+    """
+    with open(modelisation_path) as schema_file:
+        arrows_json = json.load(schema_file)
+
+    labels = {node["id"]: ":".join(node["labels"]) for node in arrows_json["nodes"]}
+    nodes = {labels[node["id"]]: list(node["properties"]) for node in arrows_json["nodes"]}
+    relationships = {(labels[rel["fromId"]], rel["type"], labels[rel["toId"]]): list(rel.get("properties", {}))
+                     for rel in arrows_json["relationships"]}
+
+    return {"nodes": nodes, "relationships": relationships}
 
 
 class SbmlDatabase:
@@ -12,7 +298,7 @@ class SbmlDatabase:
     -----------
     config_path : str
         Path to the Neo4j configuration file.
-    folder : str
+    folder : pathlib.Path
         Directory where the SBML models are stored.
     modelisation_path : str
         Path to the JSON file defining the modelisation/schema. 
@@ -29,6 +315,18 @@ class SbmlDatabase:
     import_models(model_list):
         Imports multiple SBML models into Neo4j.
 
+    import_models_bulk(model_list):
+        Imports multiple SBML models into Neo4j using batched queries.
+
+    bulk_initial_load(model_list, use_parquet, assume_empty):
+        Imports multiple SBML models into an empty database with neo4j-admin.
+
+    finish_initial_load(model_list):
+        Recreates indexes and model counts after bulk_initial_load.
+
+    sbml_to_parquet(model_ids, outdir):
+        Converts SBML models to parquet files for neo4j-admin.
+
     check_model_exists(model_id):
         Check if database contains a model.
 
@@ -38,6 +336,9 @@ class SbmlDatabase:
     compare_models(model_id1, model_id2):
         Calculates similarity between two models.
 
+    compare_all_models(model_ids):
+        Calculates similarity between every pair of models.
+
     search_for_compartment(compartment):        
         Finds models that have a specific compartment.
 
@@ -50,6 +351,8 @@ class SbmlDatabase:
     change_schema(modelisation_path):
         Change schema that converts sbml to graphs
     """
+
+    _indexes_created = set() # (config_path, database, label) of labels that already have indexes, shared by all instances
     
     def __init__(self, config_path, folder, modelisation_path):
         """
@@ -65,11 +368,47 @@ class SbmlDatabase:
             Path to the JSON file defining the chema/modelisation.
         """
         self.config_path = config_path
-        self.folder = folder
+        self.folder = pathlib.Path(folder)
         self.modelisation_path = modelisation_path
-        self.connection = connect.Connect.from_config(path=config_path) # Connection object to interact with the Neo4j database.
-        self.arr = arrows.Arrows.from_json(path=modelisation_path)
+        # Connection object to interact with the Neo4j database.
+        self.connection = SbmlConnection.from_config(config_path, lambda: connect.Connect.from_config(path=config_path))
+        self.arr = _load_arrows(modelisation_path)
         self.sbmlQueries = SbmlDatabaseQueries(connection=self.connection)
+        # Labels models may have, read once and extended with the labels of every schema used
+        self._labels = {row["label"] for row in self.connection.query("CALL db.labels() YIELD label RETURN label", expect_data=True)}
+        self._create_indexes()
+        self._compile_queries()
+
+    def _compile_queries(self) -> None:
+        """
+        Builds the import queries of every node label and relationship in the schema once
+            -- each query sets exactly the properties of the schema instead of copying a whole map per row
+        """
+        schema = _read_schema(self.modelisation_path)
+
+        self._node_cypher = {label: _node_query(label, properties) for label, properties in schema["nodes"].items()}
+        self._relationship_cypher = {
+            (rel_type, source_label, target_label): _relationship_merge(rel_type, source_label, target_label, properties)
+            for (source_label, rel_type, target_label), properties in schema["relationships"].items()
+        }
+
+    def _create_indexes(self) -> None:
+        """
+        Creates indexes on tag and (tag, id) for every label in the schema, once per process and database
+            -- lets MATCH/MERGE on a labelled model tag seek an index instead of scanning all nodes
+            -- (tag, id) is not a unique constraint as merged models share a tag and may repeat ids
+        """
+        labels = {label for labels in _read_schema(self.modelisation_path)["nodes"] for label in labels.split(":")}
+        self._labels |= labels
+
+        with self.connection.session():
+            for label in labels:
+                if (self.config_path, self.connection.database, label) in SbmlDatabase._indexes_created:
+                    continue
+
+                self.connection.query(f"CREATE INDEX IF NOT EXISTS FOR (n:{label}) ON (n.tag)", expect_data=False)
+                self.connection.query(f"CREATE INDEX IF NOT EXISTS FOR (n:{label}) ON (n.tag, n.id)", expect_data=False)
+                SbmlDatabase._indexes_created.add((self.config_path, self.connection.database, label))
 
     def load_and_import_model(self, model_id, path=False) -> None:
         """
@@ -83,27 +422,36 @@ class SbmlDatabase:
             Name/Number of the model to be imported
         """
 
-        # RESOLVE CONFLICTS -- Database queried to remove old model and continue as usual
-        if self.check_model_exists(model_id):
-            self.delete_model(model_id)
-            print(f"Deleting old model {model_id}")
+        # Missing files fail before the old model is removed
+        path_model = self._model_path(model_id, path=path)
 
-        # ADD NEW MODELS
-        if not path:
-            path_model = self.folder + "/" + model_id + ".xml"
-        else:
-            path_model = model_id 
+        # RESOLVE CONFLICTS -- Old model removed in a single query and continue as usual
+        if self._delete_existing_model(model_id):
+            logger.info("Deleting old model %s", model_id)
 
+        # ADD NEW MODELS
         tag = model_id 
-        sbm = sbml.SbmlToNeo4j.from_sbml(path=path_model, tag=tag)
+        sbm = sbml.SbmlToNeo4j.from_sbml(path=str(path_model), tag=tag)
 
         # Mapping sbml to graph
         nod = sbm.format_nodes(nodes=self.arr.nodes)
         rel = sbm.format_relationships(relationships=self.arr.relationships)
 
         # Import graph into Neo4j
-        self.connection.create_nodes(nodes=nod)
-        self.connection.create_relationships(relationships=rel)
+        self._create_graph(nod, rel)
+        self._store_model_counts([tag])
+
+
+    def _create_graph(self, nodes, relationships) -> None:
+        """
+        Imports neo4jsbml formatted nodes and relationships in chunks, each committed separately
+            -- keeps transactions of large models small, relationship chunks are smaller as each locks two nodes
+        """
+        for chunk in self._chunks(nodes, config.IMPORT_BATCH_SIZE):
+            self.connection.create_nodes(nodes=chunk)
+
+        for chunk in self._chunks(relationships, config.RELATIONSHIP_BATCH_SIZE):
+            self.connection.create_relationships(relationships=chunk)
 
 
     def merge_biomodels(self, model_id1, model_id2) -> None:
@@ -122,31 +470,33 @@ class SbmlDatabase:
 
         tag = model_id1 + "-" + model_id2 # A merged models tag/name is both model tags combined
 
-        if self.check_model_exists(tag):
-            self.delete_model(tag)
-            print(f"Deleting old model {tag}")
-
         # Specify location of two graphs
-        path_model1 = self.folder + "/" + model_id1 + ".xml"
-        path_model2 = self.folder + "/" + model_id2 + ".xml"
+        path_model1 = self._model_path(model_id1)
+        path_model2 = self._model_path(model_id2)
+
+        if self._delete_existing_model(tag):
+            logger.info("Deleting old model %s", tag)
+
+        written = set() # Nodes shared by both models are only written once
 
         # Mapping sbml to model1
-        sbm = sbml.SbmlToNeo4j.from_sbml(path=path_model1, tag=tag)
+        sbm = sbml.SbmlToNeo4j.from_sbml(path=str(path_model1), tag=tag)
         nod = sbm.format_nodes(nodes=self.arr.nodes)
         rel = sbm.format_relationships(relationships=self.arr.relationships)
+        nod = self._unwritten_nodes(nod, tag, written)
 
         # Import graph1 into Neo4j
-        self.connection.create_nodes(nodes=nod)
-        self.connection.create_relationships(relationships=rel)
+        self._create_graph(nod, rel)
 
         # Mapping sbml to model2
-        sbm = sbml.SbmlToNeo4j.from_sbml(path=path_model2, tag=tag)   
+        sbm = sbml.SbmlToNeo4j.from_sbml(path=str(path_model2), tag=tag)   
         nod = sbm.format_nodes(nodes=self.arr.nodes)
         rel = sbm.format_relationships(relationships=self.arr.relationships)
+        nod = self._unwritten_nodes(nod, tag, written)
 
         # Import graph2 into Neo4j
-        self.connection.create_nodes(nodes=nod)
-        self.connection.create_relationships(relationships=rel)
+        self._create_graph(nod, rel)
+        self._store_model_counts([tag])
 
         return tag
 
@@ -159,8 +509,277 @@ class SbmlDatabase:
             print("No new models added")
             return
 
-        for model in model_list:
-            self.load_and_import_model(model)
+        self.import_models_bulk(model_list)
+
+
+    def import_models_bulk(self, model_list) -> None:
+        """
+        Imports multiple SBML models into Neo4j with batched queries instead of per model imports
+            1) Models are mapped to graphs in parallel processes (parsing is cpu bound)
+            2) Parsed nodes/relationships are grouped by label/type and written from this process only
+            3) Old versions of the parsed models are deleted in a single query right before they are written
+            4) Each group is written with UNWIND queries of config.IMPORT_BATCH_SIZE rows
+        -- a model that fails to parse leaves its old version, and models not yet written, in the database
+
+        model_list : list
+            Names/Numbers of the models to be imported
+        """
+
+        model_paths = {model_id: self._model_path(model_id) for model_id in model_list}
+
+        # One session for the whole import
+        with self.connection.session():
+            node_rows = defaultdict(list)
+            relationship_rows = defaultdict(list)
+            tags = []
+            written = set()
+            pending = 0
+
+            for model_id, (model_nodes, model_relationships) in self._parse_models(model_paths):
+
+                for label, rows in model_nodes.items():
+                    node_rows[label].extend(rows)
+                    pending += len(rows)
+                for key, rows in model_relationships.items():
+                    relationship_rows[key].extend(rows)
+                tags.append(model_id)
+
+                # Write while other models are still being parsed
+                if pending >= config.IMPORT_BATCH_SIZE:
+                    self._write_rows(tags, node_rows, relationship_rows, written)
+                    pending = 0
+
+            self._write_rows(tags, node_rows, relationship_rows, written)
+            self._store_model_counts(list(model_list))
+
+
+    def _store_model_counts(self, tags) -> None:
+        """
+        Stores the number of elements and relationships of imported models on their Model node
+            -- read by compare_models instead of counting the graph on every comparison
+            -- must be rerun whenever the graph of a model changes
+        """
+        query = """
+                UNWIND $tags AS tag
+                MATCH (m:Model {tag: tag})
+                SET m.element_count = count{(m)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION]->()},
+                    m.relationship_count = count{(m)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION]-()}
+                """
+        self.connection.query(query, expect_data=False, parameters={"tags": tags})
+
+
+    def _model_path(self, model_id, path=False) -> pathlib.Path:
+        """
+        Returns the location of a model's sbml file
+            - path means that the model id contains the whole path and its extension
+            -- raises FileNotFoundError before any parsing or database work is done for a missing model
+        """
+        path_model = pathlib.Path(model_id) if path else self.folder / f"{model_id}.xml"
+
+        if not path_model.is_file():
+            raise FileNotFoundError(f"SBML model {model_id} not found at {path_model}")
+
+        return path_model
+
+
+    def _parse_models(self, model_paths):
+        """
+        Maps models to graphs in parallel processes (parsing is cpu bound)
+            -- model_paths maps every model id to its sbml file
+            -- yields (model id, rows) of each model as soon as it has been parsed
+        """
+        with ProcessPoolExecutor(max_workers=config.PARSING_PROCESSES) as executor:
+
+            futures = {executor.submit(_parse_model, str(path_model), model_id, self.modelisation_path): model_id
+                       for model_id, path_model in model_paths.items()}
+
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+
+    def bulk_initial_load(self, model_list, use_parquet=False, assume_empty=False) -> None:
+        """
+        Loads models into an empty database with the offline neo4j-admin importer
+            1) Models are mapped to graphs in parallel processes
+            2) Nodes are written to one file per label and relationships to csv/parquet files
+            3) neo4j-admin writes the files directly to the database store
+            4) Once the database is started again, finish_initial_load() recreates indexes and model counts
+        NB! neo4j-admin needs the database to be stopped, and overwrites it
+        -- without assume_empty the transactional import_models_bulk is used instead, as a stopped database can't be checked
+        -- parquet files need pyarrow and a neo4j-admin that accepts --input-type=parquet
+
+        model_list : list
+            Names/Numbers of the models to be imported
+        use_parquet : bool
+            Import from parquet files instead of csv files
+        assume_empty : bool
+            The database is stopped and may be overwritten
+        """
+
+        model_paths = {model_id: self._model_path(model_id) for model_id in model_list}
+
+        if not assume_empty:
+            logger.warning("Database not marked as empty, importing models with transactions")
+            self.import_models_bulk(model_list)
+            return
+
+        # Relationships with a missing endpoint fail the import instead of being skipped
+        command = [config.NEO4J_ADMIN, "database", "import", "full", "--overwrite-destination",
+                   "--skip-duplicate-nodes"]
+
+        node_rows, relationship_rows = self._collect_rows(model_paths)
+        schema = _read_schema(self.modelisation_path)
+
+        with tempfile.TemporaryDirectory() as import_folder:
+            if use_parquet:
+                node_files, relationship_files = _write_import_parquet(node_rows, relationship_rows, schema, import_folder)
+                command += ["--input-type=parquet"]
+            else:
+                node_files, relationship_file = _write_import_csvs(node_rows, relationship_rows, schema, import_folder)
+                relationship_files = [relationship_file]
+
+            command += [f"--nodes={node_file}" for node_file in node_files]
+            command += [f"--relationships={relationship_file}" for relationship_file in relationship_files]
+            command += [self.connection.database]
+
+            subprocess.run(command, check=True)
+
+        # The overwritten store has none of the indexes created by this process
+        SbmlDatabase._indexes_created -= {key for key in SbmlDatabase._indexes_created
+                                          if key[:2] == (self.config_path, self.connection.database)}
+        logger.info("Models imported, start the database and call finish_initial_load()")
+
+
+    def finish_initial_load(self, model_list) -> None:
+        """
+        Completes bulk_initial_load once the database is online again
+            -- recreates the tag indexes and stores the counts compare_models reads on each model
+
+        model_list : list
+            Names/Numbers of the models imported by bulk_initial_load
+        """
+        self._create_indexes()
+        self._store_model_counts(list(model_list))
+
+
+    def sbml_to_parquet(self, model_ids, outdir) -> tuple:
+        """
+        Converts SBML models to parquet files that neo4j-admin can import
+            -- one file per node label and per relationship type, see _write_import_parquet()
+        NB! Requires pyarrow
+
+        Return:
+            tuple: (list of node parquet paths, list of relationship parquet paths)
+        """
+        model_paths = {model_id: self._model_path(model_id) for model_id in model_ids}
+        node_rows, relationship_rows = self._collect_rows(model_paths)
+
+        return _write_import_parquet(node_rows, relationship_rows, _read_schema(self.modelisation_path), outdir)
+
+
+    def _collect_rows(self, model_paths) -> tuple:
+        """
+        Maps all models to graphs and merges their rows
+            -- for offline imports that need every row before anything is written
+
+        Return:
+            tuple: (nodes grouped by label, relationships grouped by (type, source label, target label))
+        """
+        node_rows = defaultdict(list)
+        relationship_rows = defaultdict(list)
+
+        for _, (model_nodes, model_relationships) in self._parse_models(model_paths):
+            for label, rows in model_nodes.items():
+                node_rows[label].extend(rows)
+            for key, rows in model_relationships.items():
+                relationship_rows[key].extend(rows)
+
+        return node_rows, relationship_rows
+
+
+    def _write_rows(self, tags, node_rows, relationship_rows, written) -> None:
+        """
+        Replaces the models of tags with their grouped rows, then clears tags and rows
+            -- old versions are only deleted once their new rows are parsed and about to be written
+            -- nodes are written first so relationships can match both of their endpoints
+        """
+        if tags:
+            self._delete_tagged("n.tag IN $tags", {"tags": list(tags)})
+
+        self._write_node_rows(node_rows, written)
+        self._write_relationship_rows(relationship_rows)
+        tags.clear()
+        node_rows.clear()
+        relationship_rows.clear()
+
+
+    def _write_node_rows(self, node_rows, written) -> None:
+        """
+        Merges grouped node rows into the database, one transaction per batch
+            -- rows are merged on (tag, id), _parse_model gives elements without an sbml id a key (see _element_key)
+        """
+        for label, rows in node_rows.items():
+            rows = [row for row in rows if self._mark_written(written, label, row["tag"], row["id"])]
+            query = self._node_cypher.get(label) or _node_query(label)
+            self.connection.query_batches(query, self._chunks(rows, config.IMPORT_BATCH_SIZE))
+
+
+    @staticmethod
+    def _mark_written(written, label, tag, element_id) -> bool:
+        """
+        Records that a node is written by the current import or merge in written
+            -- returns False if the same node of the same model was already written, so it is not sent again
+        """
+        if (label, tag, element_id) in written:
+            return False
+
+        written.add((label, tag, element_id))
+        return True
+
+
+    def _unwritten_nodes(self, nodes, tag, written) -> list:
+        """
+        Removes neo4jsbml formatted nodes that were already written for a model by the current import or merge
+            -- nodes without an id can't be compared and are left to neo4jsbml
+        """
+        return [node for node in nodes if node.properties.get("id") is None
+                or self._mark_written(written, ":".join(node.labels), tag, node.properties["id"])]
+
+
+    def _write_relationship_rows(self, relationship_rows) -> None:
+        """
+        Merges grouped relationship rows into the database, one transaction per batch
+            -- with config.USE_APOC, large groups are batched server side by apoc.periodic.iterate instead
+        """
+        for key, rows in relationship_rows.items():
+            merge = self._relationship_cypher.get(key) or _relationship_merge(*key)
+
+            if config.USE_APOC and len(rows) > config.APOC_BATCH_SIZE:
+                # Not parallel, relationship writes lock both of their nodes
+                query = """
+                        CALL apoc.periodic.iterate(
+                            'UNWIND $rows AS r RETURN r', $merge,
+                            {batchSize: $batch_size, parallel: false, params: {rows: $rows}}
+                        )
+                        """
+                parameters = {"rows": rows, "merge": merge, "batch_size": config.APOC_BATCH_SIZE}
+                result = self.connection.query(query, expect_data=True, parameters=parameters)
+
+                # apoc reports failed batches in its result instead of raising
+                if result and result[0]["failedOperations"] > 0:
+                    raise RuntimeError(f"apoc.periodic.iterate failed to import {result[0]['failedOperations']} "
+                                       f"{key[0]} relationships: {result[0]['errorMessages']}")
+                continue
+
+            query = "UNWIND $rows AS r " + merge
+            self.connection.query_batches(query, self._chunks(rows, config.RELATIONSHIP_BATCH_SIZE))
+
+
+    @staticmethod
+    def _chunks(rows, size):
+        """Splits rows into lists of at most size elements"""
+        for i in range(0, len(rows), size):
+            yield rows[i:i + size]
 
 
     def check_model_exists(self, model_id) -> bool:
@@ -176,8 +795,39 @@ class SbmlDatabase:
         Queries database to delete a model based on tag
             - deletes all nodes and relationships belonging to a node
         """
-        query = f"""MATCH (n) WHERE n.tag="{model_id}" DETACH DELETE n"""
-        self.connection.query(query, expect_data=False)
+        self._delete_tagged("n.tag = $tag", {"tag": model_id})
+        
+    
+    def _delete_existing_model(self, model_id) -> bool:
+        """
+        Deletes a model if it is in the database, without checking for it in a separate query
+            -- only the number of deleted nodes is returned, not the nodes themselves
+
+        Return:
+            bool: True if an old model was deleted, otherwise False
+        """
+        return self._delete_tagged("n.tag = $tag", {"tag": model_id}) > 0
+
+
+    def _delete_tagged(self, condition, parameters) -> int:
+        """
+        Deletes the nodes whose tag matches condition, with all their relationships
+            -- nodes are matched label by label so each label's tag index is used instead of scanning all nodes
+            -- labels are those in the database when the instance was created and of every schema used since,
+               so models imported with another schema are deleted too
+            -- runs as a single write transaction
+
+        Return:
+            int: number of deleted nodes
+        """
+        if not self._labels:
+            return 0
+
+        matches = " UNION ".join(f"MATCH (n:`{label}`) WHERE {condition} RETURN n" for label in sorted(self._labels))
+        query = f"CALL {{ {matches} }} DETACH DELETE n RETURN count(n) AS deleted"
+
+        result = self.connection.query(query, expect_data=True, parameters=parameters, write=True)
+        return result[0]["deleted"] if result else 0
         
     
     def compare_models(self, model_id1, model_id2) -> int:
@@ -189,6 +839,15 @@ class SbmlDatabase:
         return accuracy
     
 
+    def compare_all_models(self, model_ids) -> np.ndarray:
+        """
+        Returns matrix of similarity scores between every pair of models, in the order of model_ids
+            - Refer to SbmlDatabaseQueries.compare_all_models() for implementation details
+        """
+        similarity = self.sbmlQueries.compare_all_models(model_ids=list(model_ids))
+        return similarity
+    
+
     def search_for_compartment(self, compartment) -> list:
         """
             Returns list of models that have a certain compartment
@@ -226,8 +885,19 @@ class SbmlDatabase:
             print("Schema not found")
             return
 
+        # The schema is only switched once it loads, so a broken file leaves the current one in use
+        try:
+            arr = _load_arrows(modelisation_path)
+            _read_schema(modelisation_path)
+        except (ValueError, KeyError):
+            print("Invalid schema provided")
+            return
+
         print("Schema changed to", modelisation_path)
-        self.arr = arrows.Arrows.from_json(path=modelisation_path)
+        self.modelisation_path = modelisation_path
+        self.arr = arr
+        self._create_indexes()
+        self._compile_queries()
 
 
     def find_all_models(self) -> list:
@@ -251,6 +921,9 @@ class SbmlDatabase:
 
 if __name__ == "__main__":
 
+    # Show import progress such as replaced models
+    logging.basicConfig(level=logging.INFO)
+
     # These models are all downloaded from the biomodels database
     downloader = BiomodelsDownloader(threads=5, curatedOnly=True)
     models = downloader.verifiy_models(10) # will download all models
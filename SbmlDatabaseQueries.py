@@ -1,7 +1,90 @@
+import numpy as np
 import config
 
 """Helper Class to SbmlDatabse, Handles all query functions for class"""
 
+# Similarity of graph1_id and graph2_id, which have to be defined by the start of the query
+#   -> shared by compare_models and compare_all_models so both score pairs the same way
+SIMILARITY_QUERY = """
+        // Define weights for different similarity aspects (adjust as needed)
+        WITH graph1_id, graph2_id,
+            $w_structure AS w_structure,
+            $w_children AS w_children
+
+        // Compare nodes
+        MATCH (n1:Model {tag: graph1_id})
+        MATCH (n2:Model {tag: graph2_id})
+
+        // Compare number of nodes and relationships -> model elements are direct children of the model
+        //   -> counts are stored on the model when imported, only models imported without them are counted here
+        WITH graph1_id, graph2_id, n1, n2, w_structure, w_children,
+            CASE WHEN n1.element_count IS NULL
+                THEN count{(n1)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION]->(_)}
+                ELSE n1.element_count END AS n1_elements,
+            CASE WHEN n2.element_count IS NULL
+                THEN count{(n2)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION]->(_)}
+                ELSE n2.element_count END AS n2_elements,
+            CASE WHEN n1.relationship_count IS NULL
+                THEN count{(n1)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION]-(_)}
+                ELSE n1.relationship_count END AS n1_relationships,
+            CASE WHEN n2.relationship_count IS NULL
+                THEN count{(n2)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION]-(_)}
+                ELSE n2.relationship_count END AS n2_relationships
+
+        // Calculate structural similarity
+        WITH graph1_id, graph2_id, n1, n2, w_structure, w_children,
+            CASE WHEN n1_elements = n2_elements AND n1_relationships = n2_relationships THEN 1.0
+                ELSE (
+                    (1.0 - abs(n1_elements - n2_elements) / toFloat(n1_elements + n2_elements)) * 0.5 +
+                    (1.0 - abs(n1_relationships - n2_relationships) / toFloat(n1_relationships + n2_relationships)) * 0.5
+                )
+            END AS structural_similarity
+
+        // Collect child node ids (Compartments, Species, Reactions) of each model once, grouped by labels
+        CALL {
+            WITH n1
+            MATCH (n1)-[:HAS_COMPARTMENT|HAS_SPECIES|HAS_REACTION]->(child)
+            WITH labels(child) AS child_labels, collect(child.id) AS ids
+            RETURN collect({labels: child_labels, ids: ids}) AS groups1
+        }
+        CALL {
+            WITH n2
+            MATCH (n2)-[:HAS_COMPARTMENT|HAS_SPECIES|HAS_REACTION]->(child)
+            WITH labels(child) AS child_labels, collect(child.id) AS ids
+            RETURN collect({labels: child_labels, ids: ids}) AS groups2
+        }
+
+        // Children are only compared to children with the same labels
+        //   -> every child1 is weighted by the number of children2 sharing its labels
+        WITH graph1_id, graph2_id, w_structure, w_children, structural_similarity,
+            [g1 IN groups1 | {
+                ids: g1.ids,
+                matches: reduce(n = 0, g2 IN groups2 | n + CASE WHEN g2.labels = g1.labels THEN size(g2.ids) ELSE 0 END)
+            }] AS weighted_children1,
+            reduce(ids = [], g2 IN groups2 |
+                ids + CASE WHEN any(g1 IN groups1 WHERE g1.labels = g2.labels) THEN g2.ids ELSE [] END
+            ) AS children2_ids
+
+        WITH graph1_id, graph2_id, w_structure, w_children, structural_similarity, weighted_children1, children2_ids,
+            reduce(total = 0, c1 IN weighted_children1 | total + size(c1.ids) * c1.matches) AS total_children
+        WHERE total_children > 0
+
+        // calculation
+        WITH graph1_id, graph2_id, w_structure, w_children, structural_similarity,
+            toFloat(reduce(matching = 0, c1 IN weighted_children1 |
+                matching + size([id IN c1.ids WHERE id IN children2_ids]) * c1.matches
+            )) / total_children AS children_similarity
+
+        // Calculate final similarity score
+        WITH graph1_id, graph2_id,
+            structural_similarity * w_structure +
+            children_similarity * w_children
+            AS similarity_score
+
+        RETURN graph1_id, graph2_id, similarity_score
+"""
+
+
 class SbmlDatabaseQueries():
     """
     Methods:
@@ -13,6 +96,9 @@ class SbmlDatabaseQueries():
     compare_models(model_id1, model_id2):
         Calculates similarity between two models.
 
+    compare_all_models(model_ids):
+        Calculates similarity between every pair of models.
+
     search_for_compartment(compartment):        
         Finds models that have a specific compartment.
 
@@ -38,15 +124,13 @@ class SbmlDatabaseQueries():
             bool: True if model is found, False if not found
         """
 
-        query = f"""MATCH (n) WHERE n.tag="{model_id}" RETURN (n)"""
+        # Seeks the Model tag index and stops at the first match instead of scanning all nodes
+        query = "MATCH (n:Model {tag: $tag}) RETURN 1 LIMIT 1"
         
-        result = self.connection.query(query, expect_data=True)
+        result = self.connection.query(query, expect_data=True, parameters={"tag": model_id})
         
         # Empty results -- not found
-        if not result:
-            return False
-        
-        return True
+        return bool(result)
     
     def compare_models(self, model_id1, model_id2):
         """
@@ -55,7 +139,7 @@ class SbmlDatabaseQueries():
         Works in a single query by taking into account, structure of the graph and node data as follows:
             1) Select weighting of structure vs child nodes
             2) Get/Match the two models being compared
-            3) Count the nodes and relationships of each model -> traversal handled by neo4j
+            3) Count the nodes and relationships of each model -> stored on the model when it is imported
             4) Structural similarity is calculated by diffence in nodes and relationships independantly
             5) Child node similarity is the combination of nodes and edges/relationships eg. A HAS_SPECIES B
             6) This is compared by mathing lists of these relationships to each other
@@ -68,80 +152,49 @@ class SbmlDatabaseQueries():
         STRUCTURE_WEIGHTING = config.STRCUTURE_WEIGHTING
         CHILDREN_WEIGHTING = config.NODE_WEIGHTING
 
-        query = f"""
+        query = """
             // Define parameters for the two graphs to compare
-            WITH '{model_id1}' AS graph1_id, '{model_id2}' AS graph2_id
-
-            // Define weights for different similarity aspects (adjust as needed)
-            WITH graph1_id, graph2_id,
-                {STRUCTURE_WEIGHTING} AS w_structure,
-                {CHILDREN_WEIGHTING} AS w_children
-
-            // Compare nodes
-            MATCH (n1:Model {{tag: graph1_id}})
-            MATCH (n2:Model {{tag: graph2_id}})
-
-            // Compare number of nodes and relationships
-            WITH n1, n2, w_structure, w_children,
-                count{{(n1)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION*]->(_)}} AS n1_elements,
-                count{{(n2)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION*]->(_)}} AS n2_elements,
-                count{{(n1)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION*]-(_)}} AS n1_relationships,
-                count{{(n2)-[:HAS_COMPARTMENT|HAS_UNITDEFINITION|HAS_SPECIES|HAS_REACTION*]-(_)}} AS n2_relationships
-
-            // Calculate structural similarity
-            WITH n1, n2, w_structure, w_children,
-                CASE WHEN n1_elements = n2_elements AND n1_relationships = n2_relationships THEN 1.0
-                    ELSE (
-                        (1.0 - abs(n1_elements - n2_elements) / toFloat(n1_elements + n2_elements)) * 0.5 +
-                        (1.0 - abs(n1_relationships - n2_relationships) / toFloat(n1_relationships + n2_relationships)) * 0.5
-                    )
-                END AS structural_similarity
-
-            // Compare child nodes (Compartments, Species, Reactions, etc.)
-            MATCH (n1)-[:HAS_COMPARTMENT|HAS_SPECIES|HAS_REACTION]->(child1)
-            MATCH (n2)-[:HAS_COMPARTMENT|HAS_SPECIES|HAS_REACTION]->(child2)
-            WHERE labels(child1) = labels(child2)
-
-            WITH n1, n2, w_structure, w_children,
-                structural_similarity,
-                collect(child1) AS children1, collect(child2) AS children2
-
-            // Calculate child node similarity
-            WITH n1, n2, w_structure, w_children,
-                structural_similarity,
-                children1, children2,
-                size(children1) AS total_children
-
-            UNWIND children2 AS c2
-            WITH n1, n2, w_structure, w_children,
-                structural_similarity,
-                children1, total_children, collect(c2.id) AS children2_ids
-
-            // calculation
-            WITH n1, n2, w_structure, w_children,
-                structural_similarity,
-                total_children,
-                CASE WHEN total_children > 0
-                    THEN toFloat(size([c1 IN children1 WHERE c1.id IN children2_ids])) / total_children
-                    ELSE 1.0
-                END AS children_similarity
-
-            // Calculate final similarity score
-            WITH 
-                structural_similarity * w_structure +
-                children_similarity * w_children
-                AS similarity_score
-
-            RETURN similarity_score
-            """
-
-        result = self.connection.query(query, expect_data=True) # this accuracy is not parsed
+            WITH $g1 AS graph1_id, $g2 AS graph2_id
+            """ + SIMILARITY_QUERY
+
+        parameters = {"g1": model_id1, "g2": model_id2, "w_structure": STRUCTURE_WEIGHTING, "w_children": CHILDREN_WEIGHTING}
+        result = self.connection.query(query, expect_data=True, parameters=parameters) # this accuracy is not parsed
         if result == []: return 0
         accuracy = result[0]['similarity_score']
 
         return accuracy
     
 
+    def compare_all_models(self, model_ids):
+        """
+        Calculates the similarity of every pair of models in a single query instead of a query per pair
+            -- each unordered pair is compared once with compare_models' algorithm and mirrored
+
+        Return:
+            numpy.ndarray: Symmetric matrix of similarity scores, rows and columns in the order of model_ids
+        """
+
+        query = """
+            // One row per pair of graphs to compare
+            UNWIND $pairs AS pair
+            WITH pair[0] AS graph1_id, pair[1] AS graph2_id
+            """ + SIMILARITY_QUERY
+
+        pairs = [[model_ids[i], model_ids[j]] for i in range(len(model_ids)) for j in range(i, len(model_ids))]
+        parameters = {"pairs": pairs, "w_structure": config.STRCUTURE_WEIGHTING, "w_children": config.NODE_WEIGHTING}
+        result = self.connection.query(query, expect_data=True, parameters=parameters)
+
+        # Pairs without a result have no comparable children and score 0, as in compare_models
+        index = {model_id: i for i, model_id in enumerate(model_ids)}
+        similarity = np.zeros((len(model_ids), len(model_ids)))
+
+        for row in result:
+            i, j = index[row["graph1_id"]], index[row["graph2_id"]]
+            similarity[i, j] = similarity[j, i] = row["similarity_score"]
+
+        return similarity
+    
+
     def search_for_compartment(self, compartment):
         """
         Queries Database to find all models that has constains a specific compartment.
@@ -150,12 +203,12 @@ class SbmlDatabaseQueries():
             list: A list of all unique matching models
         """
 
-        query = f"""
+        query = """
                 MATCH (m:Model)-[:HAS_COMPARTMENT]->(c:Compartment)
-                WHERE c.id = "{compartment}"
+                WHERE c.id = $compartment
                 RETURN m
                 """
-        result = self.connection.query(query, expect_data=True)
+        result = self.connection.query(query, expect_data=True, parameters={"compartment": compartment})
 
         if not result:
             print("No models found")
@@ -177,12 +230,12 @@ class SbmlDatabaseQueries():
                 list: A list of all unique matching models
         """
 
-        query = f"""
+        query = """
                 MATCH (m:Model)-[:HAS_SPECIES]->(s:Species)
-                WHERE s.id = "{compound}"
+                WHERE s.id = $compound
                 RETURN m
                 """
-        result = self.connection.query(query, expect_data=True)
+        result = self.connection.query(query, expect_data=True, parameters={"compound": compound})
 
         if not result:
             print("No models found")
@@ -204,13 +257,14 @@ class SbmlDatabaseQueries():
             list: A list of all unique matching models
         """
 
-        query = f"""
+        query = """
                 MATCH (m:Model)-[:HAS_SPECIES]->(s:Species)-[:IN_COMPARTMENT]->(c:Compartment)
-                WHERE s.id = "{compound}" AND c.id = "{compartment}"
+                WHERE s.id = $compound AND c.id = $compartment
                 RETURN m
                 """
 
-        result = self.connection.query(query, expect_data=True)
+        parameters = {"compound": compound, "compartment": compartment}
+        result = self.connection.query(query, expect_data=True, parameters=parameters)
 
         if not result:
             print("No models found")
@@ -255,12 +309,14 @@ class SbmlDatabaseQueries():
         similar_models = []
         all_models = self.find_all_models()
 
-        # Remove merged models from comparison
-        for model in all_models:    
-            if "-" in model: continue
+        # All comparisons share one session
+        with self.connection.session():
+            # Remove merged models from comparison
+            for model in all_models:    
+                if "-" in model: continue
 
-            accuracy = self.compare_models(model_id, model)
-            similar_models.append((model, round(accuracy * 100, 2)))
+                accuracy = self.compare_models(model_id, model)
+                similar_models.append((model, round(accuracy * 100, 2)))
         
         similar_models = sorted(similar_models, key=lambda x: x[1], reverse=True)
 
@@ -1,5 +1,6 @@
 import sys
 import os
+import logging
 from PyQt6.QtWidgets import *
 from PyQt6.QtCore import *
 from PyQt6.QtGui import *
@@ -938,6 +939,7 @@ class BioGraphGUI(QMainWindow):
         visualiser.visualize(text, config_file=config.CONFIGURATION_FILE)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     app = QApplication(sys.argv)
     window = BioGraphGUI()
     window.show()
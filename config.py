@@ -1,6 +1,7 @@
 # Constants
 CHECK_UPDATED_BIOMODELS = False
 DOWNLOADING_THREADS = 10
+PARSING_PROCESSES = None # Processes used to map models to graphs when importing, None uses all cpu cores
 CURATED_ONLY = True
 NUMBER_OF_MODELS_TO_DOWNLOAD_FROM_DATABASE = 10  # defualt is -1 = all models
 
@@ -16,5 +17,11 @@ CONFIGURATION_FILE = "localhost.ini"
 DEFAULT_SCHEMA = "Schemas/default_schema.json"
 
 # DATABASE
+MAX_CONNECTION_POOL_SIZE = 50 # Bolt connections kept open by the neo4j driver
 BIOMODELS_DATABASE = "https://www.ebi.ac.uk/biomodels/search/download" # URL for downloading files
-METADATA_URL = "https://www.ebi.ac.uk/biomodels/model/files/{model}?format=json" # URL For checking model updates
\ No newline at end of file
+METADATA_URL = "https://www.ebi.ac.uk/biomodels/model/files/{model}?format=json" # URL For checking model updates
+IMPORT_BATCH_SIZE = 10000 # Number of nodes written per transaction when importing models
+RELATIONSHIP_BATCH_SIZE = 5000 # Number of relationships written per transaction, each locks two nodes
+NEO4J_ADMIN = "neo4j-admin" # Path to the neo4j-admin tool used for initial bulk loads
+USE_APOC = False # Import large relationship groups with apoc.periodic.iterate, requires the APOC plugin
+APOC_BATCH_SIZE = 5000 # Number of relationships committed per apoc batch
\ No newline at end of file
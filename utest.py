@@ -1,6 +1,10 @@
 import unittest
 from unittest.mock import patch, MagicMock
 from SbmlDatabase import SbmlDatabase
+from SbmlDatabase import _node_query, _relationship_merge, _read_schema, _element_key, _write_import_csvs, _write_import_parquet
+import csv
+import os
+import tempfile
 
 """"
 These tests are to be done everytime database is modified to make sure all changes do not affect others
@@ -57,6 +61,17 @@ class TestSbmlDatabase(unittest.TestCase):
         self.assertEqual(similarity, 1)
 
 
+    @patch('SbmlDatabase.connect')
+    def test_compare_all_models(self, mock_connect):
+        """ Test comparing every pair of models in one query - should match pairwise comparisons """
+        mock_connect.return_value = MagicMock()
+        similarity = self.database.compare_all_models(["BIOMD0000000003", "BIOMD0000000004"])
+        self.assertEqual(similarity.shape, (2, 2))
+        self.assertEqual(similarity[0][0], 1)
+        self.assertEqual(similarity[0][1], 0.9583333333333333)
+        self.assertEqual(similarity[1][0], similarity[0][1])
+
+
     @patch('SbmlDatabase.connect')
     def test_search_for_compartment(self, mock_connect):
         """ Test searching for models with a specific compartment """
@@ -108,6 +123,27 @@ class TestSbmlDatabase(unittest.TestCase):
         mock_connect().run_query.assert_not_called()  # Verify connection was made for multiple models
 
 
+    @patch('SbmlDatabase.connect')
+    def test_import_models_bulk(self, mock_connect):
+        """ Test importing multiple models with batched queries """
+        mock_connect.return_value = MagicMock()
+        model_list = ["BIOMD0000000003", "BIOMD0000000004"]
+        self.database.import_models_bulk(model_list)
+        mock_connect().run_query.assert_not_called()
+        self.assertTrue(self.database.check_model_exists("BIOMD0000000003"))
+        self.assertTrue(self.database.check_model_exists("BIOMD0000000004"))
+
+
+    @patch('SbmlDatabase.connect')
+    def test_import_models_bulk_kinetic_laws(self, mock_connect):
+        """ Test that elements without an sbml id (kinetic laws) are imported and linked to their reactions """
+        mock_connect.return_value = MagicMock()
+        self.database.import_models_bulk(["BIOMD0000000003"])
+        query = "MATCH (:Reaction {tag: $tag})-[:HAS_KENETICLAW]->(k:KineticLaw {tag: $tag}) RETURN count(k) AS laws"
+        result = self.database.connection.query(query, expect_data=True, parameters={"tag": "BIOMD0000000003"})
+        self.assertEqual(result[0]["laws"], 7)
+
+
     @patch('SbmlDatabase.connect')
     def test_check_model_exists(self, mock_connect):
         """ Test checking if a model exists """
@@ -118,5 +154,77 @@ class TestSbmlDatabase(unittest.TestCase):
         mock_connect().run_query.assert_not_called()
 
 
+class TestImportHelpers(unittest.TestCase):
+    """ Tests of the query and import file builders, these do not need a database """
+
+    def setUp(self):
+        self.schema = _read_schema("Schemas/default_schema.json")
+        self.node_rows = {"Species": [
+            {"tag": "M", "id": "A", "initialAmount": 1.0, "constant": False, "boundaryCondition": True},
+            {"tag": "M", "id": "B", "initialAmount": 2, "constant": True, "boundaryCondition": False, "extra": "x"},
+        ]}
+        self.relationship_rows = {("IS_REACTANT", "Species", "Reaction"): [{"tag": "M", "from": "A", "to": "R1", "props": {}}]}
+
+    def test_read_schema(self):
+        """ Test reading labels, properties and relationships of a schema """
+        self.assertEqual(self.schema["nodes"]["KineticLaw"], ["metaid", "id", "formula"])
+        self.assertIn(("Reaction", "HAS_KENETICLAW", "KineticLaw"), self.schema["relationships"])
+        self.assertEqual(self.schema["relationships"][("Species", "IS_REACTANT", "Reaction")], [])
+
+    def test_node_query(self):
+        """ Test compiled node queries merge on tag and id and only set schema properties """
+        self.assertEqual(_node_query("Species", ["id", "initialAmount", "constant"]),
+                         "UNWIND $rows AS row MERGE (n:Species {tag: row.tag, id: row.id}) "
+                         "SET n.`initialAmount` = row.`initialAmount`, n.`constant` = row.`constant`")
+        self.assertEqual(_node_query("Species"), "UNWIND $rows AS row MERGE (n:Species {tag: row.tag, id: row.id}) SET n += row")
+
+    def test_relationship_merge(self):
+        """ Test compiled relationship queries match both endpoints on their label, tag and id """
+        self.assertEqual(_relationship_merge("HAS_PRODUCT", "Reaction", "Species", ["stoichiometry"]),
+                         "MATCH (a:Reaction {tag: r.tag, id: r.from}) MATCH (b:Species {tag: r.tag, id: r.to}) "
+                         "MERGE (a)-[x:HAS_PRODUCT]->(b) SET x.`stoichiometry` = r.props.`stoichiometry`")
+        self.assertEqual(_relationship_merge("HAS_PRODUCT", "Reaction", "Species", []),
+                         "MATCH (a:Reaction {tag: r.tag, id: r.from}) MATCH (b:Species {tag: r.tag, id: r.to}) "
+                         "MERGE (a)-[x:HAS_PRODUCT]->(b)")
+
+    def test_element_key(self):
+        """ Test elements without an sbml id get a stable key """
+        self.assertEqual(_element_key({"id": "R1", "metaid": "_1"}), "R1")
+        self.assertEqual(_element_key({"metaid": "_355978", "formula": "k1 * A"}), "_355978")
+        unit = {"kind": "second", "exponent": -1}
+        self.assertEqual(_element_key(unit), _element_key(dict(unit, tag="M")))
+        self.assertNotEqual(_element_key(unit), _element_key({"kind": "litre", "exponent": 1}))
+
+    def test_write_import_csvs(self):
+        """ Test csv headers are typed and only contain schema properties """
+        with tempfile.TemporaryDirectory() as folder:
+            node_files, relationship_file = _write_import_csvs(self.node_rows, self.relationship_rows, self.schema, folder)
+
+            with open(node_files[0], newline="") as csv_file:
+                rows = list(csv.reader(csv_file))
+            with open(relationship_file, newline="") as csv_file:
+                relationships = list(csv.reader(csv_file))
+
+        self.assertEqual(os.path.basename(node_files[0]), "nodes_Species.csv")
+        self.assertEqual(rows[0], [":ID", ":LABEL", "tag", "id", "initialAmount:double", "boundaryCondition:boolean",
+                                   "hasOnlySubstanceUnits", "substanceUnits", "constant:boolean", "notes"])
+        self.assertEqual(rows[1][:6], ["M/Species/A", "Species", "M", "A", "1.0", "true"])
+        self.assertEqual(relationships, [[":START_ID", ":END_ID", ":TYPE"], ["M/Species/A", "M/Reaction/R1", "IS_REACTANT"]])
+
+    def test_write_import_parquet(self):
+        """ Test parquet columns keep their types, only contain schema properties and skip columns without values """
+        import pyarrow.parquet as pq
+
+        with tempfile.TemporaryDirectory() as folder:
+            node_files, relationship_files = _write_import_parquet(self.node_rows, self.relationship_rows, self.schema, folder)
+            nodes = pq.read_table(node_files[0])
+            relationships = pq.read_table(relationship_files[0])
+
+        self.assertEqual(nodes.column_names, [":ID", ":LABEL", "tag", "id", "initialAmount", "boundaryCondition", "constant"])
+        self.assertEqual(str(nodes.schema.field("initialAmount").type), "double")
+        self.assertEqual(str(nodes.schema.field("constant").type), "bool")
+        self.assertEqual(relationships.column_names, [":START_ID", ":END_ID", ":TYPE"])
+
+
 if __name__ == '__main__':
     unittest.main(argv=[''], exit=False)